@@ -2,12 +2,20 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 import io
-import base64
+import hashlib
+import json
 import logging
+import multiprocessing
 from datetime import datetime
 import os
-import tempfile
+import re
+import runpy
+import threading
+import time
 import traceback
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 # Импорт библиотек для работы с документами
 try:
@@ -17,6 +25,48 @@ try:
 except ImportError:
     pass
 
+# Быстрое декодирование base64 (SIMD), стандартная библиотека как fallback
+try:
+    import pybase64 as base64
+except ImportError:
+    import base64
+
+# Быстрая сериализация JSON-ответов, стандартный jsonify как fallback
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# lxml (зависимость python-docx) для быстрого разбора DOCX без дерева объектов
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+# Нативное расширение на Rust (каталог fast_docx) - самый быстрый разбор DOCX.
+# Включается явно через USE_FAST_DOCX=1, пока сборка не проверена на реальных файлах
+_native_docx_parts = None
+if os.environ.get('USE_FAST_DOCX') == '1':
+    try:
+        from fast_docx import extract_parts as _native_docx_parts
+    except ImportError:
+        _native_docx_parts = None
+
+# Кэш результатов обработки (один и тот же шаблон договора приходит многократно).
+# Размер ограничен суммарной длиной текстов (символов) в каждом воркере, а не
+# числом записей: по умолчанию 4M символов (около 8 МБ кириллицы), настраивается
+# через RESULT_CACHE_CHARS. У каждого воркера gunicorn свой кэш
+try:
+    from cachetools import TTLCache
+    _RESULT_CACHE = TTLCache(
+        maxsize=int(os.environ.get('RESULT_CACHE_CHARS', 4 * 1024 * 1024)),
+        ttl=3600,
+        getsizeof=lambda value: len(value[0]) + 1
+    )
+except ImportError:
+    _RESULT_CACHE = None
+_RESULT_CACHE_LOCK = threading.Lock()
+
 app = Flask(__name__)
 CORS(app)  # Разрешаем CORS для работы с n8n
 
@@ -27,128 +77,463 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-class DocumentProcessor:
-    """Класс для обработки DOC/DOCX документов"""
-    
-    @staticmethod
-    def extract_text_from_docx(file_content):
-        """Извлечение текста из DOCX с сохранением структуры"""
-        try:
-            doc = Document(io.BytesIO(file_content))
-            
-            # Собираем весь текст с сохранением структуры
-            full_text = []
-            
-            # Обработка параграфов
-            for para in doc.paragraphs:
-                if para.text.strip():
-                    full_text.append(para.text.strip())
-            
-            # Обработка таблиц
-            for table in doc.tables:
-                table_text = []
-                for row in table.rows:
-                    row_text = []
-                    for cell in row.cells:
-                        cell_text = cell.text.strip()
-                        if cell_text:
-                            row_text.append(cell_text)
-                    if row_text:
-                        table_text.append(" | ".join(row_text))
-                if table_text:
-                    full_text.append("\n[ТАБЛИЦА]\n" + "\n".join(table_text) + "\n[/ТАБЛИЦА]")
-            
-            return "\n\n".join(full_text)
-        except Exception as e:
-            logger.error(f"Ошибка при обработке DOCX: {str(e)}")
-            raise
-    
-    @staticmethod
-    def extract_text_from_doc(file_content):
-        """Извлечение текста из DOC файла используя mammoth"""
-        try:
-            # Сохраняем во временный файл для mammoth
-            with tempfile.NamedTemporaryFile(suffix='.doc', delete=False) as tmp_file:
-                tmp_file.write(file_content)
-                tmp_file_path = tmp_file.name
-            
-            # Конвертируем DOC в текст
-            with open(tmp_file_path, "rb") as docx_file:
-                result = mammoth.extract_raw_text(docx_file)
-                text = result.value
-            
-            # Удаляем временный файл
-            os.unlink(tmp_file_path)
-            
-            return text
-        except Exception as e:
-            logger.error(f"Ошибка при обработке DOC: {str(e)}")
-            # Пробуем альтернативный метод
-            return DocumentProcessor.extract_text_simple(file_content)
-    
-    @staticmethod
-    def extract_text_simple(file_content):
-        """Простое извлечение текста как fallback"""
+# Ключевые слова для определения разделов договора
+_KEYWORDS = {
+    "parties": ["стороны", "заказчик", "исполнитель", "продавец", "покупатель", "арендатор", "арендодатель"],
+    "subject": ["предмет договора", "предмет соглашения"],
+    "terms": ["сроки", "срок действия", "период"],
+    "responsibilities": ["обязанности", "ответственность", "обязательства"],
+    "signatures": ["подписи сторон", "реквизиты"]
+}
+
+# Плоский список пар (слово в нижнем регистре, раздел), подготовленный один раз
+_KEYWORDS_FLAT = tuple(
+    (word.lower(), key) for key, words in _KEYWORDS.items() for word in words
+)
+
+# Поиск всех ключевых слов за один проход по тексту (Aho-Corasick),
+# при отсутствии pyahocorasick - одно регулярное выражение с именованными группами
+try:
+    import ahocorasick
+    _KW_AUTOMATON = ahocorasick.Automaton()
+    for _word, _key in _KEYWORDS_FLAT:
+        _KW_AUTOMATON.add_word(_word, _key)
+    _KW_AUTOMATON.make_automaton()
+except ImportError:
+    _KW_AUTOMATON = None
+
+# Lookahead позволяет находить пересекающиеся вхождения, как и поиск подстрокой
+_KW_RE = re.compile('(?=' + '|'.join(
+    f"(?P<{key}>{'|'.join(re.escape(word.lower()) for word in words)})"
+    for key, words in _KEYWORDS.items()
+) + ')')
+
+# Текст приводится к нижнему регистру окнами, а не целиком, чтобы не держать
+# вторую копию большого документа; перекрытие окон покрывает самое длинное слово
+_KW_WINDOW = 65536
+_KW_OVERLAP = max(len(word) for word, _ in _KEYWORDS_FLAT) - 1
+
+def _iter_keyword_hits(text):
+    """Ключи разделов для всех вхождений ключевых слов (возможны повторы)"""
+    for start in range(0, len(text), _KW_WINDOW):
+        chunk = text[start:start + _KW_WINDOW + _KW_OVERLAP].lower()
+        if _KW_AUTOMATON is not None:
+            for _, key in _KW_AUTOMATON.iter(chunk):
+                yield key
+        else:
+            for match in _KW_RE.finditer(chunk):
+                yield match.lastgroup
+
+# Заголовки разделов: строка начинается с "§", "Статья", содержит цифру
+# в первых трех символах или целиком набрана заглавными буквами.
+# Ведущие пробелы захватываются атомарно (без возврата), а строки без строчных
+# русских/латинских букв - только кандидаты (группа caps), их проверяет isupper()
+_HEADING_RE = re.compile(
+    r'(?m)^[^\S\n]*+'
+    r'((?:§|Статья|.{0,2}\d|(?P<caps>)[^a-zа-яё\n]*$).*)$'
+)
+
+# Типы содержимого, при которых файл приходит телом запроса, и имя файла по умолчанию
+_RAW_CONTENT_TYPES = {
+    'application/octet-stream': 'document.docx',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document': 'document.docx',
+    'application/msword': 'document.doc'
+}
+
+# Шаблон подсказки для ИИ-юриста: между префиксом и суффиксом - начало текста договора
+_PROMPT_PREFIX = """Проанализируй следующий договор и предоставь юридическую оценку:
+
+1. Проверь полноту договора (наличие всех обязательных разделов)
+2. Выяви потенциальные риски для клиента
+3. Укажи на неоднозначные формулировки
+4. Предложи улучшения
+5. Оцени соответствие законодательству РФ
+
+Текст договора:
+"""
+_PROMPT_SUFFIX = "..."
+
+# Слова для подсчета: считаем вхождения без построения списка токенов
+_WORD_RE = re.compile(r'\S+')
+
+# Заведомо допустимые символы (ASCII, Latin-1, кириллица, типографская пунктуация);
+# непрерывные участки остальных символов проверяются прежним фильтром
+# isprintable() or isspace(), так что обычный текст очищается за один проход в C
+_UNUSUAL_RE = re.compile('[^\t\n\r\x20-\x7e\xa0-\xac\xae-\xff\u0400-\u04ff\u2010-\u2027\u2116]+')
+
+def _keep_printable(match):
+    """Оставляет из участка только печатаемые и пробельные символы"""
+    return ''.join(char for char in match.group() if char.isprintable() or char.isspace())
+
+# Пространство имен WordprocessingML и теги, нужные для быстрого разбора DOCX
+_W_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_W_BODY = _W_NS + 'body'
+_W_P = _W_NS + 'p'
+_W_R = _W_NS + 'r'
+_W_T = _W_NS + 't'
+_W_BR = _W_NS + 'br'
+_W_TBL = _W_NS + 'tbl'
+_W_TR = _W_NS + 'tr'
+_W_TC = _W_NS + 'tc'
+_W_HYPERLINK = _W_NS + 'hyperlink'
+_W_VAL = _W_NS + 'val'
+_W_TYPE = _W_NS + 'type'
+
+# Элементы run, которые python-docx переводит в символы
+_RUN_CHARS = {
+    _W_NS + 'tab': '\t',
+    _W_NS + 'ptab': '\t',
+    _W_NS + 'cr': '\n',
+    _W_NS + 'noBreakHyphen': '-',
+}
+
+def _run_text(run):
+    """Текст элемента w:r (аналог Run.text из python-docx)"""
+    parts = []
+    for child in run:
+        tag = child.tag
+        if tag == _W_T:
+            parts.append(child.text or '')
+        elif tag == _W_BR:
+            # Разрывы страницы и колонки текста не дают
+            if child.get(_W_TYPE, 'textWrapping') == 'textWrapping':
+                parts.append('\n')
+        elif tag in _RUN_CHARS:
+            parts.append(_RUN_CHARS[tag])
+    return ''.join(parts)
+
+def _paragraph_text(para):
+    """Текст элемента w:p, включая гиперссылки (аналог Paragraph.text)"""
+    parts = []
+    for child in para:
+        if child.tag == _W_R:
+            parts.append(_run_text(child))
+        elif child.tag == _W_HYPERLINK:
+            parts.extend(_run_text(run) for run in child.iterfind(_W_R))
+    return ''.join(parts)
+
+def _table_cells(tbl):
+    """Тексты ячеек таблицы по строкам с учетом объединений (как Table.rows в python-docx)"""
+    col_count = len(tbl.findall(f'{_W_NS}tblGrid/{_W_NS}gridCol'))
+    cells = []
+    for tc in tbl.iterfind(f'{_W_TR}/{_W_TC}'):
+        grid_span, v_merge = 1, None
+        tc_pr = tc.find(_W_NS + 'tcPr')
+        if tc_pr is not None:
+            span = tc_pr.find(_W_NS + 'gridSpan')
+            if span is not None:
+                grid_span = int(span.get(_W_VAL))
+            merge = tc_pr.find(_W_NS + 'vMerge')
+            if merge is not None:
+                v_merge = merge.get(_W_VAL, 'continue')
+        for span_idx in range(grid_span):
+            if v_merge == 'continue':
+                cells.append(cells[-col_count])
+            elif span_idx > 0:
+                cells.append(cells[-1])
+            else:
+                cells.append("\n".join(_paragraph_text(p) for p in tc.iterfind(_W_P)))
+    row_count = len(tbl.findall(_W_TR))
+    return [cells[i * col_count:(i + 1) * col_count] for i in range(row_count)]
+
+def _fast_docx_parts(file_content):
+    """Потоковый разбор word/document.xml через lxml iterparse
+
+    Возвращает тексты параграфов и таблиц верхнего уровня; обработанные
+    элементы сразу удаляются из дерева, чтобы не держать документ в памяти
+    """
+    paragraphs, tables = [], []
+    with zipfile.ZipFile(_as_stream(file_content)) as zf:
+        with zf.open('word/document.xml') as src:
+            for _, el in etree.iterparse(src, events=('end',), tag=(_W_P, _W_TBL),
+                                         resolve_entities=False):
+                parent = el.getparent()
+                # Параграфы внутри таблиц обрабатываются вместе с таблицей
+                if parent is None or parent.tag != _W_BODY:
+                    continue
+                if el.tag == _W_P:
+                    paragraphs.append(_paragraph_text(el))
+                else:
+                    tables.append(_table_cells(el))
+                el.clear(keep_tail=True)
+                while el.getprevious() is not None:
+                    del parent[0]
+    return paragraphs, tables
+
+def _as_stream(file_content):
+    """Возвращает BytesIO, готовый к чтению с начала"""
+    if isinstance(file_content, io.BytesIO):
         try:
-            # Попытка декодировать как текст
-            text = file_content.decode('utf-8', errors='ignore')
-            # Очистка от бинарных символов
-            text = ''.join(char for char in text if char.isprintable() or char.isspace())
-            return text
-        except:
-            return "Не удалось извлечь текст из документа"
-    
-    @staticmethod
-    def analyze_contract_structure(text):
-        """Анализ структуры договора для ИИ-юриста"""
-        structure = {
-            "has_parties": False,
-            "has_subject": False,
-            "has_terms": False,
-            "has_responsibilities": False,
-            "has_signatures": False,
-            "sections": []
-        }
+            file_content.seek(0)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Не удалось перемотать поток: {str(e)}")
+        return file_content
+    return io.BytesIO(file_content)
+
+def extract_text_from_docx(file_content):
+    """Извлечение текста из DOCX с сохранением структуры
+
+    Принимает байты или уже созданный BytesIO (чтобы не копировать файл повторно)
+    """
+    try:
+        paragraphs = tables = None
+        if _native_docx_parts is not None:
+            try:
+                paragraphs, tables = _native_docx_parts(_as_stream(file_content).getvalue())
+            except Exception as e:
+                logger.warning(f"Нативный разбор DOCX не удался: {str(e)}")
         
-        # Ключевые слова для определения разделов
-        keywords = {
-            "parties": ["стороны", "заказчик", "исполнитель", "продавец", "покупатель", "арендатор", "арендодатель"],
-            "subject": ["предмет договора", "предмет соглашения"],
-            "terms": ["сроки", "срок действия", "период"],
-            "responsibilities": ["обязанности", "ответственность", "обязательства"],
-            "signatures": ["подписи сторон", "реквизиты"]
-        }
+        if paragraphs is None and etree is not None:
+            try:
+                paragraphs, tables = _fast_docx_parts(file_content)
+            except Exception as e:
+                logger.warning(f"Быстрый разбор DOCX не удался, используем python-docx: {str(e)}")
         
-        text_lower = text.lower()
+        if paragraphs is None:
+            doc = Document(_as_stream(file_content))
+            paragraphs = (para.text for para in doc.paragraphs)
+            tables = (
+                [[cell.text for cell in row.cells] for row in table.rows]
+                for table in doc.tables
+            )
         
-        # Проверка наличия ключевых разделов
-        for key, words in keywords.items():
-            for word in words:
-                if word in text_lower:
-                    structure[f"has_{key}"] = True
-                    break
+        # Собираем весь текст с сохранением структуры (параграфы)
+        full_text = [t for text in paragraphs if (t := text.strip())]
         
-        # Извлечение заголовков разделов
-        lines = text.split('\n')
-        for line in lines:
-            line_stripped = line.strip()
-            if line_stripped and (
-                line_stripped.isupper() or 
-                any(char.isdigit() for char in line_stripped[:3]) or
-                line_stripped.startswith('§') or
-                line_stripped.startswith('Статья')
-            ):
-                if len(line_stripped) < 100:  # Ограничиваем длину заголовка
-                    structure["sections"].append(line_stripped)
+        # Обработка таблиц
+        for table in tables:
+            rows = [" | ".join(c for c in (cell.strip() for cell in row) if c) for row in table]
+            rows = [r for r in rows if r]
+            if rows:
+                full_text.append("\n[ТАБЛИЦА]\n" + "\n".join(rows) + "\n[/ТАБЛИЦА]")
+        
+        return "\n\n".join(full_text)
+    except Exception as e:
+        logger.error(f"Ошибка при обработке DOCX: {str(e)}")
+        raise
+
+def extract_text_from_doc(file_content):
+    """Извлечение текста из DOC файла используя mammoth"""
+    try:
+        # mammoth читает напрямую из памяти, без временного файла
+        result = mammoth.extract_raw_text(_as_stream(file_content))
+        return result.value
+    except Exception as e:
+        logger.error(f"Ошибка при обработке DOC: {str(e)}")
+        # Пробуем альтернативный метод
+        if isinstance(file_content, io.BytesIO):
+            file_content = file_content.getvalue()
+        return extract_text_simple(file_content)
+
+def extract_text_simple(file_content):
+    """Простое извлечение текста как fallback"""
+    try:
+        # Попытка декодировать как текст
+        text = file_content.decode('utf-8', errors='ignore')
+        # Очистка от бинарных символов
+        return _UNUSUAL_RE.sub(_keep_printable, text)
+    except:
+        return "Не удалось извлечь текст из документа"
+
+def analyze_contract_structure(text):
+    """Анализ структуры договора для ИИ-юриста"""
+    structure = {
+        "has_parties": False,
+        "has_subject": False,
+        "has_terms": False,
+        "has_responsibilities": False,
+        "has_signatures": False,
+        "sections": []
+    }
+    
+    # Проверка наличия ключевых разделов
+    found = set()
+    for key in _iter_keyword_hits(text):
+        found.add(key)
+        if len(found) == len(_KEYWORDS):
+            break
+    for key in found:
+        structure[f"has_{key}"] = True
+    
+    # Извлечение заголовков разделов
+    for match in _HEADING_RE.finditer(text):
+        heading = match.group(1).strip()
+        if match.group('caps') is not None and not heading.isupper():
+            continue
+        if len(heading) < 100:  # Ограничиваем длину заголовка
+            structure["sections"].append(heading)
+    
+    return structure
+
+# Метка времени обновляется не чаще раза в секунду
+_TS = ''
+_TS_T = 0.0
+
+def now_iso():
+    """Текущее время в ISO-формате с точностью до секунды кэширования"""
+    global _TS, _TS_T
+    t = time.monotonic()
+    if not _TS or t - _TS_T > 1.0:
+        _TS = datetime.now().isoformat()
+        _TS_T = t
+    return _TS
+
+def json_response(obj, status=200):
+    """JSON-ответ через orjson (быстрее для больших текстов)"""
+    if orjson is not None:
+        return app.response_class(orjson.dumps(obj), status=status, mimetype='application/json')
+    response = jsonify(obj)
+    response.status_code = status
+    return response
+
+def count_words(text):
+    """Количество слов в тексте (аналог len(text.split()) без списка)"""
+    return sum(1 for _ in _WORD_RE.finditer(text))
+
+def get_request_json():
+    """Разбор JSON-тела запроса без сохранения сырых байтов в кэше Werkzeug"""
+    raw = request.get_data(cache=False)
+    if not raw:
+        return None
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+def read_file_content(data):
+    """Получение байтов файла из JSON-запроса (None, если файла нет)
+
+    Поле с файлом удаляется из data сразу после декодирования, чтобы
+    не держать в памяти и base64-строку, и байты
+    """
+    # Проверяем разные форматы входных данных
+    if 'file_base64' in data:
+        # Файл в base64
+        return base64.b64decode(data.pop('file_base64'), validate=False)
+    elif 'file_content' in data:
+        # Прямое содержимое файла
+        file_content = data.pop('file_content')
+        if isinstance(file_content, str):
+            return file_content.encode('utf-8')
+        return file_content
+    elif 'binary' in data:
+        # Бинарные данные из n8n
+        return base64.b64decode(data.pop('binary'), validate=False)
+    return None
+
+def extract_text_any(file_content):
+    """Извлечение текста из файла неизвестного типа"""
+    # Пробуем как DOCX по умолчанию, при ошибке - как DOC (поток тот же)
+    try:
+        return extract_text_from_docx(file_content)
+    except:
+        return extract_text_from_doc(file_content)
+
+# Обработчики по расширению файла
+_EXTRACTORS = {
+    '.docx': extract_text_from_docx,
+    '.doc': extract_text_from_doc
+}
+
+def extract_text(file_content, file_name):
+    """Извлечение текста с выбором обработчика по расширению файла"""
+    extractor = _EXTRACTORS.get(os.path.splitext(file_name)[1].lower(), extract_text_any)
+    # Один поток на весь запрос - переиспользуется при fallback на DOC
+    return extractor(io.BytesIO(file_content))
+
+def _warmup():
+    """Инициализация процесса пула: заранее загружаем библиотеки для документов"""
+    try:
+        import docx
+        import mammoth
+    except ImportError:
+        pass
+
+def _process_one(file_data):
+    """Обработка одного файла из пакетного запроса (выполняется в процессе пула)"""
+    if not isinstance(file_data, dict):
+        file_data = {}
+    file_name = file_data.get('filename', 'document.docx')
+    try:
+        file_content = read_file_content(file_data)
+        if file_content is None:
+            return {
+                "success": False,
+                "filename": file_name,
+                "error": "Файл не найден. Используйте поля: file_base64, file_content или binary"
+            }
         
-        return structure
+        text = extract_text(file_content, file_name)
+        return {
+            "success": True,
+            "filename": file_name,
+            "text": text,
+            "text_length": len(text),
+            "word_count": count_words(text),
+            "contract_analysis": analyze_contract_structure(text),
+            "file_size_bytes": len(file_content)
+        }
+    except Exception as e:
+        logger.error(f"Ошибка при пакетной обработке {file_name}: {str(e)}")
+        return {
+            "success": False,
+            "filename": file_name,
+            "error": str(e),
+            "error_type": type(e).__name__
+        }
+
+# Пул процессов для пакетной обработки создается лениво, уже после fork
+# воркеров gunicorn, чтобы не наследовать его между процессами.
+# Дочерние процессы запускаются через forkserver (или spawn, где его нет, например
+# в Windows): fork многопоточного воркера (gthread) мог бы унаследовать
+# захваченную блокировку, например логирования.
+# Размер пула по умолчанию - cpu_count; под gunicorn (задан WEB_CONCURRENCY) -
+# cpu_count / WEB_CONCURRENCY, но не меньше 2, чтобы пакет разбирался параллельно,
+# а все воркеры вместе не запускали cpu_count² процессов
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+def _pool_context():
+    """Контекст multiprocessing для пула: forkserver, если доступен, иначе spawn"""
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(['docx', 'mammoth', 'lxml.etree'])
+        return context
+    return multiprocessing.get_context('spawn')
+
+def _pool_size():
+    """Число процессов пула в одном воркере (переменная WORKERS или доля CPU)"""
+    if 'WORKERS' in os.environ:
+        return int(os.environ['WORKERS'])
+    cpu_count = os.cpu_count() or 1
+    if 'WEB_CONCURRENCY' not in os.environ:
+        return cpu_count
+    web_workers = max(1, int(os.environ['WEB_CONCURRENCY']))
+    return max(2, cpu_count // web_workers)
+
+def _get_pool():
+    """Возвращает общий пул процессов для /process-batch"""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ProcessPoolExecutor(
+                max_workers=_pool_size(),
+                mp_context=_pool_context(),
+                initializer=_warmup
+            )
+    return _POOL
+
+def _reset_pool(pool):
+    """Отбрасывает сломанный пул (упал дочерний процесс) - следующий вызов создаст новый"""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is pool:
+            _POOL = None
+    pool.shutdown(wait=False, cancel_futures=True)
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Проверка работоспособности сервера"""
-    return jsonify({
+    return json_response({
         "status": "healthy",
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": now_iso(),
         "service": "Document Processor for n8n"
     })
 
@@ -159,53 +544,51 @@ def process_document():
     Принимает файл в base64 или бинарном формате
     """
     try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({
-                "success": False,
-                "error": "Нет данных в запросе"
-            }), 400
-        
-        # Получаем содержимое файла
-        file_content = None
-        file_name = data.get('filename', 'document.docx')
-        
-        # Проверяем разные форматы входных данных
-        if 'file_base64' in data:
-            # Файл в base64
-            file_content = base64.b64decode(data['file_base64'])
-        elif 'file_content' in data:
-            # Прямое содержимое файла
-            if isinstance(data['file_content'], str):
-                file_content = data['file_content'].encode('utf-8')
-            else:
-                file_content = data['file_content']
-        elif 'binary' in data:
-            # Бинарные данные из n8n
-            file_content = base64.b64decode(data['binary'])
+        if request.mimetype in _RAW_CONTENT_TYPES:
+            # Файл передан телом запроса (binary mode n8n) - без JSON и base64
+            file_name = request.headers.get('X-Filename', _RAW_CONTENT_TYPES[request.mimetype])
+            file_content = request.get_data(cache=False) or None
         else:
-            return jsonify({
+            data = get_request_json()
+            
+            if not data:
+                return json_response({
+                    "success": False,
+                    "error": "Нет данных в запросе"
+                }, 400)
+            
+            # Получаем содержимое файла
+            file_name = data.get('filename', 'document.docx')
+            file_content = read_file_content(data)
+        
+        if file_content is None:
+            return json_response({
                 "success": False,
                 "error": "Файл не найден в запросе. Используйте поля: file_base64, file_content или binary"
-            }), 400
+            }, 400)
         
-        # Определяем тип файла и извлекаем текст
-        processor = DocumentProcessor()
+        # Ищем результат в кэше по хэшу содержимого файла
+        cache_key = cached = None
+        if _RESULT_CACHE is not None:
+            cache_key = (
+                hashlib.blake2b(file_content, digest_size=16).digest(),
+                os.path.splitext(file_name)[1].lower()
+            )
+            with _RESULT_CACHE_LOCK:
+                cached = _RESULT_CACHE.get(cache_key)
         
-        if file_name.endswith('.docx'):
-            text = processor.extract_text_from_docx(file_content)
-        elif file_name.endswith('.doc'):
-            text = processor.extract_text_from_doc(file_content)
+        if cached is not None:
+            text, structure = cached
         else:
-            # Пробуем как DOCX по умолчанию
-            try:
-                text = processor.extract_text_from_docx(file_content)
-            except:
-                text = processor.extract_text_from_doc(file_content)
-        
-        # Анализируем структуру договора
-        structure = processor.analyze_contract_structure(text)
+            # Определяем тип файла и извлекаем текст
+            text = extract_text(file_content, file_name)
+            
+            # Анализируем структуру договора
+            structure = analyze_contract_structure(text)
+            
+            if _RESULT_CACHE is not None and len(text) < _RESULT_CACHE.maxsize:
+                with _RESULT_CACHE_LOCK:
+                    _RESULT_CACHE[cache_key] = (text, structure)
         
         # Подготавливаем ответ
         response = {
@@ -213,29 +596,30 @@ def process_document():
             "filename": file_name,
             "text": text,
             "text_length": len(text),
-            "word_count": len(text.split()),
+            "word_count": count_words(text),
             "contract_analysis": structure,
             "metadata": {
-                "processed_at": datetime.now().isoformat(),
+                "processed_at": now_iso(),
                 "file_size_bytes": len(file_content)
             }
         }
         
         # Добавляем рекомендации для ИИ-юриста
         if text:
-            response["ai_instructions"] = {
-                "prompt_suggestion": f"""Проанализируй следующий договор и предоставь юридическую оценку:
-
-1. Проверь полноту договора (наличие всех обязательных разделов)
-2. Выяви потенциальные риски для клиента
-3. Укажи на неоднозначные формулировки
-4. Предложи улучшения
-5. Оцени соответствие законодательству РФ
-
-Текст договора:
-{text[:2000]}...""",
-                "has_content": True
-            }
+            preview = text[:2000]
+            if request.args.get('prompt') == 'parts':
+                # Клиент сам склеивает подсказку - не собираем строку на сервере
+                response["ai_instructions"] = {
+                    "prompt_suggestion_head": _PROMPT_PREFIX,
+                    "preview": preview,
+                    "tail": _PROMPT_SUFFIX,
+                    "has_content": True
+                }
+            else:
+                response["ai_instructions"] = {
+                    "prompt_suggestion": _PROMPT_PREFIX + preview + _PROMPT_SUFFIX,
+                    "has_content": True
+                }
         else:
             response["ai_instructions"] = {
                 "prompt_suggestion": "Документ не содержит текста для анализа",
@@ -243,16 +627,16 @@ def process_document():
             }
         
         logger.info(f"Успешно обработан документ: {file_name}")
-        return jsonify(response)
+        return json_response(response)
         
     except Exception as e:
         logger.error(f"Ошибка при обработке документа: {str(e)}")
         logger.error(traceback.format_exc())
-        return jsonify({
+        return json_response({
             "success": False,
             "error": str(e),
             "error_type": type(e).__name__
-        }), 500
+        }, 500)
 
 @app.route('/process-n8n', methods=['POST'])
 def process_n8n_format():
@@ -261,41 +645,93 @@ def process_n8n_format():
     """
     try:
         # n8n может отправлять данные в разных форматах
-        if request.content_type == 'application/json':
-            data = request.get_json()
+        data = None
+        file_content = None
+        if request.is_json:
+            data = get_request_json()
         else:
             # Если n8n отправляет файл напрямую
-            file_content = request.data
-            
-        # Обработка для n8n Telegram node
-        if isinstance(data, dict) and 'data' in data:
-            # Формат от Telegram Get File
-            telegram_data = data['data']
-            if 'file_path' in telegram_data:
-                # Здесь должен быть base64 контент файла
-                file_content = base64.b64decode(telegram_data.get('file_content', ''))
+            file_content = request.get_data(cache=False)
+        
+        if isinstance(data, dict):
+            telegram_data = data.get('data')
+            if isinstance(telegram_data, dict) and 'file_path' in telegram_data:
+                # Формат от Telegram Get File - здесь должен быть base64 контент файла
+                file_content = base64.b64decode(telegram_data.get('file_content', ''), validate=False)
             else:
-                file_content = base64.b64decode(data.get('binary', ''))
+                file_content = read_file_content(data)
+        
+        if not file_content:
+            return json_response({
+                "text": "",
+                "success": False,
+                "error": "Файл не найден в запросе"
+            }, 400)
         
         # Извлекаем текст
-        processor = DocumentProcessor()
-        text = processor.extract_text_from_docx(file_content)
+        text = extract_text_from_docx(file_content)
         
         # Упрощенный ответ для n8n
-        return jsonify({
+        return json_response({
             "text": text,
             "success": True,
-            "word_count": len(text.split()),
+            "word_count": count_words(text),
             "ready_for_ai": True
         })
         
     except Exception as e:
         logger.error(f"Ошибка n8n обработки: {str(e)}")
-        return jsonify({
+        return json_response({
             "text": "",
             "success": False,
             "error": str(e)
-        }), 500
+        }, 500)
+
+@app.route('/process-batch', methods=['POST'])
+def process_batch():
+    """
+    Пакетная обработка нескольких документов параллельно в пуле процессов
+    Принимает {"files": [{"file_base64": ..., "filename": ...}, ...]}
+    """
+    try:
+        data = get_request_json()
+        files = data.get('files') if isinstance(data, dict) else None
+        
+        if not isinstance(files, list) or not files:
+            return json_response({
+                "success": False,
+                "error": "Нет файлов в запросе. Используйте поле files со списком файлов"
+            }, 400)
+        
+        pool = _get_pool()
+        try:
+            results = list(pool.map(_process_one, files, chunksize=1))
+        except BrokenProcessPool:
+            # Процесс пула погиб (OOM, падение lxml) - пересоздаем пул и повторяем один раз
+            logger.warning("Пул процессов сломан, создаем новый и повторяем пакет")
+            _reset_pool(pool)
+            pool = _get_pool()
+            try:
+                results = list(pool.map(_process_one, files, chunksize=1))
+            except BrokenProcessPool:
+                _reset_pool(pool)
+                raise
+        
+        logger.info(f"Пакетно обработано документов: {len(results)}")
+        return json_response({
+            "success": all(r["success"] for r in results),
+            "count": len(results),
+            "results": results
+        })
+        
+    except Exception as e:
+        logger.error(f"Ошибка пакетной обработки: {str(e)}")
+        logger.error(traceback.format_exc())
+        return json_response({
+            "success": False,
+            "error": str(e),
+            "error_type": type(e).__name__
+        }, 500)
 
 @app.route('/', methods=['GET'])
 def index():
@@ -327,6 +763,10 @@ def index():
     "filename": "contract.docx"
 }
             </pre>
+            <p>Файл можно передать и напрямую телом запроса
+            (<code>Content-Type: application/octet-stream</code>), имя - в заголовке <code>X-Filename</code></p>
+            <p>С параметром <code>?prompt=parts</code> подсказка для ИИ возвращается частями:
+            <code>prompt_suggestion_head</code> + <code>preview</code> + <code>tail</code></p>
         </div>
         
         <div class="endpoint">
@@ -334,6 +774,19 @@ def index():
             <p>Специальный эндпоинт для n8n (упрощенный формат)</p>
         </div>
         
+        <div class="endpoint">
+            <h3>POST /process-batch</h3>
+            <p>Параллельная обработка нескольких документов</p>
+            <pre>
+{
+    "files": [
+        {"file_base64": "...", "filename": "contract1.docx"},
+        {"file_base64": "...", "filename": "contract2.doc"}
+    ]
+}
+            </pre>
+        </div>
+        
         <div class="endpoint">
             <h3>GET /health</h3>
             <p>Проверка работоспособности сервиса</p>
@@ -353,5 +806,30 @@ def index():
     """
 
 if __name__ == '__main__':
-    port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
+    # В продакшене запускаемся под gunicorn (настройки в gunicorn.conf.py),
+    # встроенный сервер Flask - только если gunicorn недоступен (например, Windows)
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        port = int(os.environ.get('PORT', 5000))
+        app.run(host='0.0.0.0', port=port, debug=False)
+    else:
+        class DocumentProcessorServer(BaseApplication):
+            """gunicorn с уже импортированным приложением и настройками из gunicorn.conf.py"""
+            
+            def __init__(self, application, config_path):
+                self.application = application
+                self.config_path = config_path
+                super().__init__()
+            
+            def load_config(self):
+                config = runpy.run_path(self.config_path)
+                for key, value in config.items():
+                    if key in self.cfg.settings and value is not None:
+                        self.cfg.set(key, value)
+            
+            def load(self):
+                return self.application
+        
+        config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py')
+        DocumentProcessorServer(app, config_path).run()
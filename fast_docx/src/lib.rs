@@ -0,0 +1,274 @@
+//! Нативное извлечение текста из DOCX для Document Processor API.
+//!
+//! Повторяет логику `_fast_docx_parts` из app.py: потоково читает
+//! word/document.xml и возвращает тексты параграфов и таблиц верхнего
+//! уровня с теми же правилами, что и python-docx (Run.text, гиперссылки,
+//! объединенные ячейки). Итоговый текст собирается на стороне Python.
+
+use std::io::{BufReader, Cursor, Read, Seek};
+
+use pyo3::exceptions::PyValueError;
+use pyo3::prelude::*;
+use quick_xml::events::{BytesStart, Event};
+use quick_xml::name::{Namespace, ResolveResult};
+use quick_xml::NsReader;
+
+const W_NS: &[u8] = b"http://schemas.openxmlformats.org/wordprocessingml/2006/main";
+
+type Table = Vec<Vec<String>>;
+
+#[derive(Clone, Copy, PartialEq, Eq)]
+enum Kind {
+    Body,
+    P,
+    R,
+    Hyperlink,
+    T,
+    Br,
+    Tab,
+    Cr,
+    NoBreakHyphen,
+    Tbl,
+    TblGrid,
+    GridCol,
+    Tr,
+    Tc,
+    TcPr,
+    GridSpan,
+    VMerge,
+    Other,
+}
+
+impl Kind {
+    fn from_local(local: &[u8]) -> Kind {
+        match local {
+            b"body" => Kind::Body,
+            b"p" => Kind::P,
+            b"r" => Kind::R,
+            b"hyperlink" => Kind::Hyperlink,
+            b"t" => Kind::T,
+            b"br" => Kind::Br,
+            b"tab" | b"ptab" => Kind::Tab,
+            b"cr" => Kind::Cr,
+            b"noBreakHyphen" => Kind::NoBreakHyphen,
+            b"tbl" => Kind::Tbl,
+            b"tblGrid" => Kind::TblGrid,
+            b"gridCol" => Kind::GridCol,
+            b"tr" => Kind::Tr,
+            b"tc" => Kind::Tc,
+            b"tcPr" => Kind::TcPr,
+            b"gridSpan" => Kind::GridSpan,
+            b"vMerge" => Kind::VMerge,
+            _ => Kind::Other,
+        }
+    }
+
+    /// Учитывается ли элемент при данном родителе (только содержимое
+    /// параграфов и таблиц верхнего уровня, как в python-docx).
+    fn counted_under(self, parent: Kind) -> bool {
+        match self {
+            Kind::P => matches!(parent, Kind::Body | Kind::Tc),
+            Kind::Hyperlink => parent == Kind::P,
+            Kind::R => matches!(parent, Kind::P | Kind::Hyperlink),
+            Kind::T | Kind::Br | Kind::Tab | Kind::Cr | Kind::NoBreakHyphen => parent == Kind::R,
+            Kind::Tbl => parent == Kind::Body,
+            Kind::TblGrid | Kind::Tr => parent == Kind::Tbl,
+            Kind::GridCol => parent == Kind::TblGrid,
+            Kind::Tc => parent == Kind::Tr,
+            Kind::TcPr => parent == Kind::Tc,
+            Kind::GridSpan | Kind::VMerge => parent == Kind::TcPr,
+            Kind::Body | Kind::Other => false,
+        }
+    }
+}
+
+struct Frame {
+    kind: Kind,
+    counted: bool,
+}
+
+#[derive(Default)]
+struct TableState {
+    col_count: usize,
+    row_count: usize,
+    cells: Vec<String>,
+}
+
+struct CellState {
+    grid_span: usize,
+    v_merge: Option<String>,
+    paragraphs: Vec<String>,
+}
+
+fn attr_value(e: &BytesStart, local: &[u8]) -> Result<Option<String>, String> {
+    for attr in e.attributes() {
+        let attr = attr.map_err(|err| err.to_string())?;
+        if attr.key.local_name().as_ref() == local {
+            let value = attr.unescape_value().map_err(|err| err.to_string())?;
+            return Ok(Some(value.into_owned()));
+        }
+    }
+    Ok(None)
+}
+
+fn finish_cell(table: &mut TableState, cell: CellState) -> Result<(), String> {
+    for span_idx in 0..cell.grid_span {
+        if cell.v_merge.as_deref() == Some("continue") {
+            // Как cells[-col_count] в Python: без tblGrid (col_count == 0) это cells[0]
+            let idx = if table.col_count == 0 {
+                Some(0)
+            } else {
+                table.cells.len().checked_sub(table.col_count)
+            };
+            let above = idx
+                .and_then(|i| table.cells.get(i))
+                .cloned()
+                .ok_or("vMerge continue без ячейки выше")?;
+            table.cells.push(above);
+        } else if span_idx > 0 {
+            let last = table.cells.last().cloned().unwrap_or_default();
+            table.cells.push(last);
+        } else {
+            table.cells.push(cell.paragraphs.join("\n"));
+        }
+    }
+    Ok(())
+}
+
+fn finish_table(table: TableState) -> Table {
+    let len = table.cells.len();
+    (0..table.row_count)
+        .map(|i| {
+            let start = (i * table.col_count).min(len);
+            let end = ((i + 1) * table.col_count).min(len);
+            table.cells[start..end].to_vec()
+        })
+        .collect()
+}
+
+fn parse_document<R: Read>(src: R) -> Result<(Vec<String>, Vec<Table>), String> {
+    let mut reader = NsReader::from_reader(BufReader::new(src));
+    reader.config_mut().expand_empty_elements = true;
+
+    let mut paragraphs = Vec::new();
+    let mut tables = Vec::new();
+    let mut stack: Vec<Frame> = Vec::new();
+    let mut para = String::new();
+    let mut table = TableState::default();
+    let mut cell: Option<CellState> = None;
+    let mut buf = Vec::new();
+
+    loop {
+        match reader
+            .read_resolved_event_into(&mut buf)
+            .map_err(|err| err.to_string())?
+        {
+            (ns, Event::Start(e)) => {
+                let kind = match ns {
+                    ResolveResult::Bound(Namespace(uri)) if uri == W_NS => {
+                        Kind::from_local(e.local_name().as_ref())
+                    }
+                    _ => Kind::Other,
+                };
+                let counted = kind == Kind::Body
+                    || stack
+                        .last()
+                        .map_or(false, |parent| parent.counted && kind.counted_under(parent.kind));
+                if counted {
+                    match kind {
+                        Kind::P => para.clear(),
+                        Kind::Br => {
+                            // Разрывы страницы и колонки текста не дают
+                            let br_type = attr_value(&e, b"type")?;
+                            if br_type.as_deref().unwrap_or("textWrapping") == "textWrapping" {
+                                para.push('\n');
+                            }
+                        }
+                        Kind::Tab => para.push('\t'),
+                        Kind::Cr => para.push('\n'),
+                        Kind::NoBreakHyphen => para.push('-'),
+                        Kind::Tbl => table = TableState::default(),
+                        Kind::GridCol => table.col_count += 1,
+                        Kind::Tr => table.row_count += 1,
+                        Kind::Tc => {
+                            cell = Some(CellState {
+                                grid_span: 1,
+                                v_merge: None,
+                                paragraphs: Vec::new(),
+                            })
+                        }
+                        Kind::GridSpan => {
+                            if let (Some(c), Some(val)) = (cell.as_mut(), attr_value(&e, b"val")?) {
+                                c.grid_span = val.parse().map_err(|_| format!("gridSpan: {}", val))?;
+                            }
+                        }
+                        Kind::VMerge => {
+                            if let Some(c) = cell.as_mut() {
+                                let val = attr_value(&e, b"val")?;
+                                c.v_merge = Some(val.unwrap_or_else(|| "continue".to_string()));
+                            }
+                        }
+                        _ => {}
+                    }
+                }
+                stack.push(Frame { kind, counted });
+            }
+            (_, Event::Text(e)) => {
+                if let Some(Frame { kind: Kind::T, counted: true }) = stack.last() {
+                    para.push_str(&e.unescape().map_err(|err| err.to_string())?);
+                }
+            }
+            (_, Event::CData(e)) => {
+                if let Some(Frame { kind: Kind::T, counted: true }) = stack.last() {
+                    para.push_str(&String::from_utf8_lossy(&e));
+                }
+            }
+            (_, Event::End(_)) => {
+                let frame = stack.pop().ok_or("Незакрытый элемент")?;
+                match frame.kind {
+                    _ if !frame.counted => {}
+                    Kind::P => {
+                        let text = std::mem::take(&mut para);
+                        match (stack.last().map(|f| f.kind), cell.as_mut()) {
+                            (Some(Kind::Tc), Some(c)) => c.paragraphs.push(text),
+                            _ => paragraphs.push(text),
+                        }
+                    }
+                    Kind::Tc => {
+                        if let Some(c) = cell.take() {
+                            finish_cell(&mut table, c)?;
+                        }
+                    }
+                    Kind::Tbl => tables.push(finish_table(std::mem::take(&mut table))),
+                    _ => {}
+                }
+            }
+            (_, Event::Eof) => break,
+            _ => {}
+        }
+        buf.clear();
+    }
+
+    Ok((paragraphs, tables))
+}
+
+fn extract<R: Read + Seek>(src: R) -> Result<(Vec<String>, Vec<Table>), String> {
+    let mut archive = zip::ZipArchive::new(src).map_err(|err| err.to_string())?;
+    let document = archive
+        .by_name("word/document.xml")
+        .map_err(|err| err.to_string())?;
+    parse_document(document)
+}
+
+/// Тексты параграфов и таблиц (строки -> ячейки) верхнего уровня DOCX.
+#[pyfunction]
+fn extract_parts(py: Python<'_>, data: &[u8]) -> PyResult<(Vec<String>, Vec<Table>)> {
+    py.allow_threads(|| extract(Cursor::new(data)))
+        .map_err(PyValueError::new_err)
+}
+
+#[pymodule]
+fn fast_docx(m: &Bound<'_, PyModule>) -> PyResult<()> {
+    m.add_function(wrap_pyfunction!(extract_parts, m)?)?;
+    Ok(())
+}
@@ -0,0 +1,21 @@
+# gunicorn.conf.py - Настройки продакшн-сервера для Document Processor API
+# Запуск: gunicorn -c gunicorn.conf.py app:app
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# Приложение (python-docx, lxml, mammoth) загружается один раз в мастер-процессе,
+# воркеры после fork используют общие страницы памяти
+preload_app = True
+
+# Каждый воркер лениво создает свой пул для /process-batch размером WORKERS
+# (по умолчанию max(2, cpu_count / WEB_CONCURRENCY)), всего процессов разбора -
+# до WEB_CONCURRENCY * WORKERS. Число воркеров экспортируется в окружение,
+# чтобы app.py делил CPU между ними
+workers = int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1))
+os.environ['WEB_CONCURRENCY'] = str(workers)
+worker_class = 'gthread'
+threads = int(os.environ.get('THREADS', 4))
+
+# Большие документы могут обрабатываться дольше стандартных 30 секунд
+timeout = int(os.environ.get('TIMEOUT', 120))